@@ -1,117 +1,52 @@
 import streamlit as st
+import time
 from openai import OpenAI
-import os
-from dotenv import load_dotenv
-import bcrypt
-import json
-from datetime import datetime, timedelta
-from jose import JWTError, jwt
-from typing import Optional
+from auth import (
+    TOKEN_RENEW_BEFORE_MINUTES,
+    get_user_db,
+    user_rows,
+    create_access_token,
+    verify_token,
+    revoke_token
+)
+from email_generator import (
+    MODEL_FAST,
+    MODEL_SMART,
+    MIN_EMAIL_LENGTH,
+    OPENAI_TIMEOUT_SECONDS,
+    OPENAI_MAX_RETRIES,
+    get_time_based_greeting,
+    stream_email_response,
+    generate_batch_responses,
+    parse_batch_emails
+)
+from response_templates import RESPONSE_CATEGORIES, RESPONSE_OPTIONS
 
 
-load_dotenv()  # Load environment variables from .env
-
-# Security configurations
-SECRET_KEY = st.secrets["JWT_SECRET_KEY"]  # Add this to your streamlit secrets
-ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
 LOGIN_REQUIRED = st.secrets["LOGIN_REQUIRED"]
 
+# Responses generated per request: (title, maximum length in words)
+RESPONSE_LENGTHS = (
+    ("✉️ Resposta Curta (50 palavras):", 50),
+    ("✉️ Resposta Detalhada (100 palavras):", 100)
+)
+
 # Initialize session state for authentication
 if 'authenticated' not in st.session_state:
     st.session_state.authenticated = False
     
 
-class UserDB:
-    """Secure user database management"""
-    def __init__(self):
-        self.users_file = "secure_users.json"
-        self._load_users()
-    
-    def _load_users(self):
-        """Load users from secure storage"""
-        try:
-            if not os.path.exists(self.users_file):
-                # Create default admin if file doesn't exist
-                admin_password = st.secrets["ADMIN_PASSWORD"]  # Get from Streamlit secrets
-                hashed_password = self._hash_password(admin_password)
-                self.users = {
-                    "admin": {
-                        "hashed_password": hashed_password,
-                        "name": "Administrator",
-                        "role": "admin"
-                    }
-                }
-                self._save_users()
-            else:
-                with open(self.users_file, 'r') as f:
-                    self.users = json.load(f)
-        except Exception as e:
-            st.error(f"Error loading users: {str(e)}")
-            self.users = {}
-    
-    def _save_users(self):
-        """Save users to secure storage"""
-        try:
-            with open(self.users_file, 'w') as f:
-                json.dump(self.users, f)
-        except Exception as e:
-            st.error(f"Error saving users: {str(e)}")
-    
-    def _hash_password(self, password: str) -> str:
-        """Hash a password using bcrypt"""
-        return bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
-    
-    def verify_password(self, plain_password: str, hashed_password: str) -> bool:
-        """Verify a password against its hash"""
-        try:
-            return bcrypt.checkpw(
-                plain_password.encode(), 
-                hashed_password.encode()
-            )
-        except Exception:
-            return False
-    
-    def authenticate_user(self, username: str, password: str) -> Optional[dict]:
-        """Authenticate a user and return user data if successful"""
-        if username not in self.users:
-            return None
-        user = self.users[username]
-        if not self.verify_password(password, user["hashed_password"]):
-            return None
-        return user
-    
-    def create_user(self, username: str, password: str, name: str, role: str = "user"):
-        """Create a new user"""
-        if username in self.users:
-            raise ValueError("Username already exists")
-        
-        hashed_password = self._hash_password(password)
-        self.users[username] = {
-            "hashed_password": hashed_password,
-            "name": name,
-            "role": role
-        }
-        self._save_users()
-
-def create_access_token(data: dict):
-    """Create a JWT access token"""
-    to_encode = data.copy()
-    expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
-
-def verify_token(token: str) -> Optional[dict]:
-    """Verify a JWT token"""
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
-    except JWTError:
-        return None
-
 # Initialize UserDB
-user_db = UserDB()
+user_db = get_user_db()
+
+@st.cache_resource
+def get_openai_client():
+    """Keep one OpenAI client, and its HTTPS connection pool, across reruns"""
+    return OpenAI(
+        api_key=st.secrets["OPENAI_API_KEY"],
+        timeout=OPENAI_TIMEOUT_SECONDS,
+        max_retries=OPENAI_MAX_RETRIES
+    )
 
 def check_password(username: str, password: str) -> bool:
     """Verify username and password"""
@@ -145,7 +80,12 @@ def login_page():
                 st.error("Nome de utilizador ou palavra-passe incorretos")
 
 def verify_session():
-    """Verify if the current session is valid"""
+    """
+    Verify if the current session is valid.
+
+    Checks the JWT issued at login, so reruns only pay for an HMAC check
+    instead of another bcrypt password verification.
+    """
     if 'access_token' not in st.session_state:
         return False
     
@@ -153,15 +93,22 @@ def verify_session():
     if not token_data:
         return False
     
+    st.session_state.username = token_data["sub"]
+    st.session_state.user_role = token_data["role"]
+
+    # Renew tokens close to expiry so active users aren't logged out mid-draft
+    if token_data["exp"] - time.time() < TOKEN_RENEW_BEFORE_MINUTES * 60:
+        revoke_token(st.session_state.access_token)
+        st.session_state.access_token = create_access_token(
+            {"sub": token_data["sub"], "role": token_data["role"]}
+        )
     return True
 
 def main_app():
     """Main application code"""
     OPENAI_API_KEY = st.secrets["OPENAI_API_KEY"]
 
-    client = OpenAI(
-        api_key=OPENAI_API_KEY
-    )
+    client = get_openai_client()
 
     if LOGIN_REQUIRED == "YES":
         # Add logout button and user management in sidebar
@@ -197,203 +144,182 @@ def main_app():
                 # List existing users
                 with st.expander("👥 Listar Utilizadores"):
                     st.markdown("#### Utilizadores Existentes:")
-                    for username, user_data in user_db.users.items():
+                    user_db.reload_if_changed()
+                    for username, name, role in user_rows(user_db.mtime):
                         st.markdown(f"""
                         **{username}**
-                        - Nome: {user_data['name']}
-                        - Função: {user_data['role']}
+                        - Nome: {name}
+                        - Função: {role}
                         ---
                         """)
             
             # Logout button
             if st.button("📤 Terminar Sessão"):
-                st.session_state.authenticated = False
+                if 'access_token' in st.session_state:
+                    revoke_token(st.session_state.access_token)
+                st.session_state.clear()
                 st.rerun()
 
     # App Title
     st.title("Gerador de Respostas da MBC")
 
-    # Create categories of responses
-    response_categories = {
-        "Resolução de Problemas": [
-            "Explicar causa do problema",
-            "Oferecer substituição gratuita",
-            "Informar sobre reembolso",
-            "Pedir desculpas por atraso na entrega",
-            "Explicar política de devoluções"
-        ],
-        "Informações sobre Produtos": [
-            "Fornecer informações sobre tamanhos",
-            "Explicar materiais e cuidados",
-            "Informar sobre disponibilidade",
-            "Explicar processo de personalização",
-            "Fornecer guia de medidas"
-        ],
-        "Envios e Portes": [
-            "Explicar que portes gratis não são possíveis",
-            "Informar prazo de entrega estimado",
-            "Fornecer informação de tracking",
-            "Explicar custos de envio internacional"
-        ],
-        "Ofertas e Descontos": [
-            "Oferecer desconto compensatório",
-            "Informar sobre promoções atuais",
-            "Oferecer voucher de desconto futuro",
-            "Explicar programa de fidelidade"
-        ]
-    }
-
-    avoid = [
-        "Desculpe", 
-        "Desculpa", 
-        "culpa", 
-        "nossa culpa",
-        "erro nosso",
-        "falha nossa",
-        "não podemos",
-        "impossível",
-        "não é possível",
-        "complicado"
-    ]
-
-    # Create tabs for better organization
-    tab1, tab2 = st.tabs(["Composição do Email", "Configurações Avançadas"])
-
-    with tab1:
-        # Text input for customer email
-        customer_email = st.text_area("📧 Email do Cliente:", height=150)
+    # Keep all inputs in one form so editing them doesn't rerun the script;
+    # it only reruns when one of the submit buttons is pressed
+    with st.form("compose"):
+        # Create tabs for better organization
+        tab1, tab2, tab3 = st.tabs(["Composição do Email", "Configurações Avançadas", "Modo em Lote"])
+
+        with tab1:
+            # Text input for customer email
+            customer_email = st.text_area("📧 Email do Cliente:", height=150)
         
-        # Multiselect for response types, organized by category
-        selected_responses = []
-        additional_instructions = []
-        for category, options in response_categories.items():
-            st.subheader(f"🔹 {category}")
-            category_selections = st.multiselect(
-                "Selecione as opções aplicáveis:",
-                options,
-                key=category
+            # A single multiselect for response types, labelled by category
+            selected_options = st.multiselect(
+                "🔹 Selecione as opções aplicáveis:",
+                RESPONSE_OPTIONS,
+                format_func=lambda category_option: " › ".join(category_option),
+                key="response_options"
             )
-            additional_instructions.append(st.text_area(f"📝 [Opcional] Instruções Adicionais para {category}:", height=70))
-            selected_responses.extend(category_selections)
-        
-        # Manager notes with improved UI
-        manager_note = st.text_area("📝 Notas Finais (opcional):", height=100)
-
-    with tab2:
-        # Tone selection
-        tone = st.select_slider(
-            "Tom da Resposta:",
-            options=["Muito Formal", "Formal", "Neutro", "Amigável", "Casual"],
-            value="Neutro"
-        )
-        
-        # Response length
-        max_length = st.slider(
-            "Comprimento da Resposta:",
-            min_value=50,
-            max_value=500,
-            value=200,
-            step=50,
-            help="Número aproximado de palavras na resposta"
-        )
-        
-        # Additional customization
-        include_signature = st.checkbox("Incluir Assinatura da Empresa", value=True)
-        include_contact = st.checkbox("Incluir Informações de Contacto", value=True)
-    
-    def get_time_based_greeting():
+            selected_responses = [option for _, option in selected_options]
+
+            additional_instructions = [
+                st.text_area(f"📝 [Opcional] Instruções Adicionais para {category}:", height=70)
+                for category in RESPONSE_CATEGORIES
+            ]
         
-        """
-        Determine the appropriate greeting based on the current time.
+            # Manager notes with improved UI
+            manager_note = st.text_area("📝 Notas Finais (opcional):", height=100)
+
+        with tab2:
+            # Tone selection
+            tone = st.select_slider(
+                "Tom da Resposta:",
+                options=["Muito Formal", "Formal", "Neutro", "Amigável", "Casual"],
+                value="Neutro"
+            )
         
-        Returns:
-            str: The appropriate greeting (Bom dia, Boa tarde, or Boa noite)
-        """
-        current_hour = datetime.now().hour
+            # Response length
+            max_length = st.slider(
+                "Comprimento da Resposta:",
+                min_value=50,
+                max_value=500,
+                value=200,
+                step=50,
+                help="Número aproximado de palavras na resposta"
+            )
         
-        if 5 <= current_hour < 12:
-            return "Bom dia"
-        elif 12 <= current_hour < 19:
-            return "Boa tarde"
-        else:
-            return "Boa noite"
-
-
-    def generate_email_response(email_text, max_length):
+            # Additional customization
+            include_signature = st.checkbox("Incluir Assinatura da Empresa", value=True)
+            include_contact = st.checkbox("Incluir Informações de Contacto", value=True)
+
+            # Model selection, only for admins (or when login is disabled)
+            if LOGIN_REQUIRED != "YES" or st.session_state.get("user_role") == "admin":
+                model = st.radio(
+                    "Modelo:",
+                    options=[MODEL_FAST, MODEL_SMART],
+                    format_func=lambda m: "Rápido" if m == MODEL_FAST else "Avançado (mais lento)",
+                    horizontal=True,
+                    help="O modelo avançado só é necessário para emails mais complexos"
+                )
+            else:
+                model = MODEL_FAST
+
+        with tab3:
+            st.markdown("Gere respostas para vários emails de uma só vez, com as opções e configurações escolhidas nos outros separadores.")
+            pasted_emails = st.text_area("📧 Emails dos Clientes (um por linha):", height=200)
+            uploaded_emails = st.file_uploader("📄 Ou carregue um ficheiro CSV (coluna \"email\"):", type="csv")
+
+            if st.form_submit_button("📤 Gerar Respostas em Lote"):
+                try:
+                    batch_emails, skipped_emails = parse_batch_emails(pasted_emails, uploaded_emails)
+                except ValueError as e:
+                    st.error(str(e))
+                else:
+                    if skipped_emails:
+                        st.warning(
+                            f"⚠️ {skipped_emails} email(s) ignorado(s) por serem demasiado curtos "
+                            f"(mínimo de {MIN_EMAIL_LENGTH} caracteres)"
+                        )
+                    if not selected_responses:
+                        st.warning("⚠️ Selecione pelo menos uma opção de resposta")
+                    elif batch_emails:
+                        with st.spinner(f"A gerar {len(batch_emails)} respostas..."):
+                            batch_responses = generate_batch_responses(
+                                OPENAI_API_KEY,
+                                batch_emails,
+                                selected_responses=tuple(selected_responses),
+                                tone=tone,
+                                max_length=max_length,
+                                include_signature=include_signature,
+                                include_contact=include_contact,
+                                greeting=get_time_based_greeting(),
+                                additional_instructions=tuple(additional_instructions),
+                                manager_note=manager_note,
+                                model=model
+                            )
 
-        # Get time-based greeting
-        greeting = get_time_based_greeting()
+                        # Keep the table so it survives later reruns
+                        st.session_state.last_batch = [
+                            {
+                                "Email do Cliente": email,
+                                "Resposta": f"Erro: {response}" if isinstance(response, Exception) else response
+                            }
+                            for email, response in zip(batch_emails, batch_responses)
+                        ]
+                        st.success("Respostas geradas com sucesso!")
+                    else:
+                        st.warning("⚠️ Por favor insira pelo menos um email")
 
-        prompt = f"""
-        Act as a polite customer service agent for a clothing brand. 
-        Your task is to generate a polite, brand-consistent email reply in Portuguese from Portugal.
+            if 'last_batch' in st.session_state:
+                st.dataframe(st.session_state.last_batch, use_container_width=True)
 
-        Guidelines:
-        - Tone: {tone}
-        - Maximum length: {max_length} words
-        - Include signature: {include_signature}
-        - Include contact info: {include_contact}
-        - Use the following greeting: {greeting}
-
-        Customer email:
-        {email_text}
-        
-        The reply email should address the following points:
-        {", ".join(selected_responses)}
-        
-        Avoid these expressions/words:
-        {", ".join(avoid)}
-
-        {f"Here are some additional instructions: {', '.join(additional_instructions)}" if additional_instructions else ""}
-        
-        {f"And final manager: {manager_note}" if manager_note else ""}
-        
-        Key requirements:
-        1. Use Portuguese from Portugal
-        2. Be polite and concise
-        3. Maintain a professional tone
-        4. Focus on solutions
-        """
-        
-        response = client.chat.completions.create(
-            model="gpt-4-turbo-preview",  # Updated to a more capable model
-            messages=[
-                {"role": "system", "content": prompt},
-                {"role": "user", "content": customer_email}
-            ],
-            temperature=0.7,  # Add some creativity while maintaining professionalism
-            max_tokens=1000
-        )
-        
-        return response.choices[0].message.content
+        generate_submitted = st.form_submit_button("📤 Gerar Resposta", type="primary")
 
     # Improved response display
-    if st.button("📤 Gerar Resposta", type="primary"):
-        if customer_email:
+    if generate_submitted:
+        # Reject degenerate requests before they reach OpenAI
+        if not selected_responses:
+            st.warning("⚠️ Selecione pelo menos uma opção de resposta")
+        elif len(customer_email.strip()) >= MIN_EMAIL_LENGTH:
             with st.spinner("A gerar resposta..."):
 
-                short_ai_response = generate_email_response(customer_email, max_length=50)
-                detailed_ai_response = generate_email_response(customer_email, max_length=100)
+                greeting = get_time_based_greeting()
+                request_args = dict(
+                    email_text=customer_email,
+                    selected_responses=tuple(selected_responses),
+                    tone=tone,
+                    include_signature=include_signature,
+                    include_contact=include_contact,
+                    greeting=greeting,
+                    additional_instructions=tuple(additional_instructions),
+                    manager_note=manager_note,
+                    model=model
+                )
+
+                # Stream each response into a chat message as plain text (the
+                # reply is an email, not markdown), then keep the final text in
+                # session state instead of an editable widget
+                responses = []
+                for title, length in RESPONSE_LENGTHS:
+                    st.subheader(title)
+                    with st.chat_message("assistant"):
+                        placeholder = st.empty()
+                        ai_response = stream_email_response(client, placeholder, max_length=length, **request_args)
+                        # st.code keeps the plain text and has a copy button
+                        placeholder.code(ai_response, language=None, wrap_lines=True)
+                    responses.append((title, ai_response))
+                st.session_state.last_response = responses
 
                 st.success("Respostas gerada com sucesso!")
-
-                # Display short response
-                st.subheader("✉️ Resposta Curta (50 palavras):")
-                st.text_area("", short_ai_response, height=200)
-                st.button("📋 Copiar Resposta Curta", 
-                     on_click=lambda: st.write(short_response))
-            
-                # Display detailed response
-                st.subheader("✉️ Resposta Detalhada (100 palavras):")
-                st.text_area("", detailed_ai_response, height=300)
-                st.button("📋 Copiar Resposta Detalhada", 
-                     on_click=lambda: st.write(detailed_response))
-                
-                # Add copy button
-                st.button("📋 Copiar para Área de Transferência", 
-                         on_click=lambda: st.write(ai_response))
+        elif customer_email.strip():
+            st.warning(f"⚠️ O email do cliente é demasiado curto (mínimo de {MIN_EMAIL_LENGTH} caracteres)")
         else:
             st.warning("⚠️ Por favor insira o email do cliente")
+    elif 'last_response' in st.session_state:
+        for title, ai_response in st.session_state.last_response:
+            st.subheader(title)
+            with st.chat_message("assistant"):
+                st.code(ai_response, language=None, wrap_lines=True)
 
     # Add helpful footer
     st.markdown("---")
@@ -401,7 +327,9 @@ def main_app():
 
 # Check if the user is authenticated, if not, show the login page
 if LOGIN_REQUIRED == "YES":
-    if not st.session_state.authenticated:
+    if not st.session_state.authenticated or not verify_session():
+        # Missing or expired token: fall back to a full password login
+        st.session_state.authenticated = False
         login_page()
     else:
         main_app()
@@ -0,0 +1,172 @@
+import streamlit as st
+import os
+import bcrypt
+import json
+import functools
+import time
+import uuid
+from datetime import datetime, timedelta
+import jwt
+from jwt import InvalidTokenError
+from typing import Optional
+
+
+# Security configurations
+SECRET_KEY = st.secrets["JWT_SECRET_KEY"]  # Add this to your streamlit secrets
+_SECRET_BYTES = SECRET_KEY.encode()  # Encode the HS256 key once, not per token
+ALGORITHM = "HS256"
+ACCESS_TOKEN_EXPIRE_MINUTES = 30
+TOKEN_RENEW_BEFORE_MINUTES = 10  # Active sessions get a fresh token this close to expiry
+PASSWORD_ROUNDS = 10  # bcrypt cost for user passwords
+
+# jti -> exp of revoked tokens; entries are dropped once the token has expired anyway
+_REVOKED: dict[str, float] = {}
+
+
+class UserDB:
+    """Secure user database management"""
+    def __init__(self):
+        self.users_file = "secure_users.json"
+        self._mtime = None
+        self._load_users()
+    
+    def _load_users(self):
+        """Load users from secure storage"""
+        try:
+            if not os.path.exists(self.users_file):
+                # Create default admin if file doesn't exist
+                admin_password = st.secrets["ADMIN_PASSWORD"]  # Get from Streamlit secrets
+                hashed_password = self._hash_password(admin_password)
+                self.users = {
+                    "admin": {
+                        "hashed_password": hashed_password,
+                        "name": "Administrator",
+                        "role": "admin"
+                    }
+                }
+                self._save_users()
+            else:
+                with open(self.users_file, 'r') as f:
+                    self.users = json.load(f)
+                self._mtime = os.path.getmtime(self.users_file)
+        except Exception as e:
+            st.error(f"Error loading users: {str(e)}")
+            self.users = {}
+            self._mtime = None
+
+    def reload_if_changed(self):
+        """Reload users from storage only if the file changed since the last read"""
+        try:
+            mtime = os.path.getmtime(self.users_file)
+        except OSError:
+            return
+        if self._mtime is None or mtime > self._mtime:
+            self._load_users()
+    
+    @property
+    def mtime(self) -> Optional[float]:
+        """Modification time of the users file when it was last read or written"""
+        return self._mtime
+    
+    def _save_users(self):
+        """Save users to secure storage"""
+        try:
+            with open(self.users_file, 'w') as f:
+                json.dump(self.users, f)
+            self._mtime = os.path.getmtime(self.users_file)
+        except Exception as e:
+            st.error(f"Error saving users: {str(e)}")
+    
+    def _hash_password(self, password: str, rounds: int = PASSWORD_ROUNDS) -> str:
+        """
+        Hash a password using bcrypt.
+
+        Existing hashes keep verifying whatever cost they used, since bcrypt
+        reads it back from the stored hash.
+        """
+        return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds=rounds)).decode()
+    
+    def verify_password(self, plain_password: str, hashed_password: str) -> bool:
+        """Verify a password against its hash"""
+        try:
+            return bcrypt.checkpw(
+                plain_password.encode(), 
+                hashed_password.encode()
+            )
+        except Exception:
+            return False
+    
+    def authenticate_user(self, username: str, password: str) -> Optional[dict]:
+        """Authenticate a user and return user data if successful"""
+        self.reload_if_changed()
+        if username not in self.users:
+            return None
+        user = self.users[username]
+        if not self.verify_password(password, user["hashed_password"]):
+            return None
+        return user
+    
+    def create_user(self, username: str, password: str, name: str, role: str = "user"):
+        """Create a new user"""
+        self.reload_if_changed()
+        if username in self.users:
+            raise ValueError("Username already exists")
+        
+        hashed_password = self._hash_password(password)
+        self.users[username] = {
+            "hashed_password": hashed_password,
+            "name": name,
+            "role": role
+        }
+        self._save_users()
+
+def create_access_token(data: dict):
+    """Create a JWT access token"""
+    to_encode = data.copy()
+    expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
+    encoded_jwt = jwt.encode(to_encode, _SECRET_BYTES, algorithm=ALGORITHM)
+    return encoded_jwt
+
+@functools.lru_cache(maxsize=1024)
+def _decode_token(token: str) -> dict:
+    """Check a token's signature once; expiry is checked by verify_token on every call"""
+    return jwt.decode(token, _SECRET_BYTES, algorithms=[ALGORITHM], options={"verify_exp": False})
+
+def verify_token(token: str) -> Optional[dict]:
+    """Verify a JWT token"""
+    try:
+        payload = _decode_token(token)
+    except InvalidTokenError:
+        return None
+    if payload.get("exp", 0) <= time.time():
+        return None
+    if payload.get("jti") in _REVOKED:
+        return None
+    return dict(payload)
+
+def revoke_token(token: str):
+    """Invalidate a JWT so it no longer verifies, e.g. on logout"""
+    payload = verify_token(token)
+    if payload and "jti" in payload:
+        _REVOKED[payload["jti"]] = payload["exp"]
+
+    now = time.time()
+    for jti, exp in list(_REVOKED.items()):
+        if exp <= now:
+            _REVOKED.pop(jti, None)  # Another session may have pruned it already
+
+@st.cache_resource
+def get_user_db():
+    """Keep a single UserDB across reruns instead of re-reading it each time"""
+    return UserDB()
+
+@st.cache_data(ttl=30)
+def user_rows(mtime: Optional[float]) -> list[tuple[str, str, str]]:
+    """
+    Project the users into display rows, keyed on the users file mtime.
+
+    Only the username, name and role leave here, so render code never touches
+    password hashes. Never call verify_password while rendering users.
+    """
+    return [(username, user_data['name'], user_data['role']) for username, user_data in get_user_db().users.items()]
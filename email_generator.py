@@ -0,0 +1,236 @@
+import streamlit as st
+from openai import AsyncOpenAI
+import json
+import asyncio
+import csv
+import io
+import hashlib
+import logging
+import diskcache
+from datetime import datetime
+from response_templates import SYSTEM_PROMPT, REQUEST_PROMPT_TEMPLATE
+
+
+# OpenAI configurations
+MODEL_FAST = "gpt-4o-mini"
+MODEL_SMART = "gpt-4o"
+TOKENS_PER_WORD = 2  # Portuguese averages ~1.5 tokens per word, plus headroom
+REPLY_FRAME_TOKENS = 150  # Greeting, closing, signature and contact lines, not counted in max_length
+OPENAI_TIMEOUT_SECONDS = 30
+OPENAI_MAX_RETRIES = 2
+OPENAI_CACHE_DIR = "./.cache/openai"
+OPENAI_CACHE_EXPIRE_SECONDS = 86400
+STREAM_RENDER_EVERY = 8  # Streamed chunks between placeholder updates
+BATCH_CONCURRENCY = 8  # Concurrent OpenAI requests in batch mode
+MIN_EMAIL_LENGTH = 10  # Shorter emails are rejected without calling OpenAI
+CSV_ENCODINGS = ("utf-8-sig", "cp1252")  # Tried in order for uploaded batch files
+CSV_DELIMITERS = (",", ";", "\t")
+CSV_MISSING_EMAIL_COLUMN = "O ficheiro CSV tem de ter uma linha de cabeçalho com a coluna \"email\"."
+
+logger = logging.getLogger(__name__)
+
+@st.cache_resource
+def get_response_cache():
+    """Open the on-disk cache of OpenAI completions"""
+    return diskcache.Cache(OPENAI_CACHE_DIR)
+
+def get_time_based_greeting():
+    """
+    Determine the appropriate greeting based on the current time.
+
+    Returns:
+        str: The appropriate greeting (Bom dia, Boa tarde, or Boa noite)
+    """
+    current_hour = datetime.now().hour
+
+    if 5 <= current_hour < 12:
+        return "Bom dia"
+    elif 12 <= current_hour < 19:
+        return "Boa tarde"
+    else:
+        return "Boa noite"
+
+def build_completion_request(email_text, selected_responses, tone, max_length,
+                             include_signature, include_contact, greeting,
+                             additional_instructions, manager_note, model=MODEL_FAST) -> dict:
+    """
+    Build the chat completion arguments for one email reply.
+
+    Every value that ends up in the prompt is an explicit argument, and
+    response_cache_key hashes the result, so any change to the prompts or
+    sampling settings produces a new cache key.
+    """
+    request_prompt = REQUEST_PROMPT_TEMPLATE.substitute(
+        tone=tone,
+        max_length=max_length,
+        include_signature=include_signature,
+        include_contact=include_contact,
+        greeting=greeting,
+        selected_responses=", ".join(selected_responses),
+        additional_instructions=f"Here are some additional instructions: {', '.join(additional_instructions)}" if additional_instructions else "",
+        manager_note=f"And final manager: {manager_note}" if manager_note else ""
+    )
+
+    return dict(
+        model=model,
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "system", "content": request_prompt},
+            {"role": "user", "content": email_text}
+        ],
+        temperature=0,  # Deterministic output so cached replies stay valid
+        max_tokens=int(max_length * TOKENS_PER_WORD) + REPLY_FRAME_TOKENS
+    )
+
+def response_cache_key(request_args: dict) -> str:
+    """Hash the exact completion request (model, messages, temperature, max_tokens) into a cache key"""
+    completion_request = build_completion_request(**request_args)
+    return hashlib.sha256(json.dumps(completion_request, sort_keys=True).encode()).hexdigest()
+
+def generate_email_response(client, **request_args):
+    """
+    Stream an email reply from OpenAI as it arrives.
+
+    Yields:
+        tuple: (text, finish_reason) for each chunk; finish_reason stays None
+        until the final chunk of the reply
+    """
+    stream = client.chat.completions.create(
+        **build_completion_request(**request_args),
+        stream=True,
+        stream_options={"include_usage": True}
+    )
+
+    for chunk in stream:
+        if chunk.usage:
+            usage_details = getattr(chunk.usage, "prompt_tokens_details", None)
+            cached_tokens = getattr(usage_details, "cached_tokens", 0) if usage_details else 0
+            logger.info("OpenAI prompt tokens: %s (cached: %s)", chunk.usage.prompt_tokens, cached_tokens)
+        if chunk.choices:
+            choice = chunk.choices[0]
+            yield choice.delta.content or "", choice.finish_reason
+
+def stream_email_response(client, placeholder, **request_args) -> str:
+    """
+    Render an email reply into a placeholder while it is generated.
+
+    Replies for identical inputs are served from the disk cache without
+    calling OpenAI; new replies are stored there only if they finished
+    normally, so truncated or filtered replies can be regenerated.
+
+    Returns:
+        str: The complete reply
+    """
+    cache = get_response_cache()
+    key = response_cache_key(request_args)
+    buf = cache.get(key)
+    if buf is not None:
+        return buf
+
+    buf = ""
+    finish_reason = None
+    for i, (chunk, chunk_finish_reason) in enumerate(generate_email_response(client, **request_args), start=1):
+        buf += chunk
+        finish_reason = chunk_finish_reason or finish_reason
+        # Re-render every few chunks rather than on each token
+        if i % STREAM_RENDER_EVERY == 0:
+            placeholder.text(buf)
+
+    if finish_reason == "stop":
+        cache.set(key, buf, expire=OPENAI_CACHE_EXPIRE_SECONDS)
+    else:
+        logger.warning("Not caching OpenAI reply with finish_reason %s", finish_reason)
+    return buf
+
+async def _generate_batch_responses(api_key: str, emails: list, request_args: dict) -> list:
+    """Generate replies for several emails concurrently, at most BATCH_CONCURRENCY at a time"""
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async with AsyncOpenAI(
+        api_key=api_key,
+        timeout=OPENAI_TIMEOUT_SECONDS,
+        max_retries=OPENAI_MAX_RETRIES
+    ) as aclient:
+        async def generate_one(email_text):
+            async with semaphore:
+                response = await aclient.chat.completions.create(
+                    **build_completion_request(email_text=email_text, **request_args)
+                )
+                choice = response.choices[0]
+                return choice.message.content, choice.finish_reason
+
+        return await asyncio.gather(*(generate_one(email) for email in emails), return_exceptions=True)
+
+def generate_batch_responses(api_key: str, emails: list, **request_args) -> list:
+    """
+    Generate one reply per email, sending the uncached ones to OpenAI concurrently.
+
+    Returns:
+        list: The reply for each email, or the exception raised for it
+    """
+    cache = get_response_cache()
+    keys = [response_cache_key(dict(request_args, email_text=email)) for email in emails]
+    results = [cache.get(key) for key in keys]
+
+    pending = [i for i, result in enumerate(results) if result is None]
+    if pending:
+        responses = asyncio.run(_generate_batch_responses(
+            api_key, [emails[i] for i in pending], request_args
+        ))
+        for i, response in zip(pending, responses):
+            if isinstance(response, Exception):
+                results[i] = response
+                continue
+            results[i], finish_reason = response
+            # Only complete replies are cached, as in stream_email_response
+            if finish_reason == "stop":
+                cache.set(keys[i], results[i], expire=OPENAI_CACHE_EXPIRE_SECONDS)
+            else:
+                logger.warning("Not caching OpenAI reply with finish_reason %s", finish_reason)
+
+    return results
+
+def parse_batch_emails(pasted_emails: str, uploaded_file) -> tuple[list, int]:
+    """
+    Collect batch emails from the pasted text (one per line) and an optional CSV.
+
+    Emails shorter than MIN_EMAIL_LENGTH are dropped so they never reach OpenAI;
+    blank lines are ignored.
+
+    Returns:
+        tuple: The emails to answer and how many non-blank entries were too short
+
+    Raises:
+        ValueError: If the CSV is in an encoding that cannot be read or has
+            no "email" column
+    """
+    emails = [line.strip() for line in pasted_emails.splitlines()]
+    if uploaded_file is not None:
+        text = _decode_csv(uploaded_file.getvalue())
+        lines = text.splitlines()
+        header = lines[0] if lines else ""
+        # Excel in the PT locale saves with ";" rather than ","
+        delimiter = max(CSV_DELIMITERS, key=header.count)
+        if header.count(delimiter) == 0:
+            # A single column: emails may contain commas, so read whole lines
+            if header.strip().strip('"').lower() != "email":
+                raise ValueError(CSV_MISSING_EMAIL_COLUMN)
+            emails.extend(line.strip() for line in lines[1:])
+        else:
+            rows = csv.DictReader(io.StringIO(text), delimiter=delimiter)
+            column = next((name for name in rows.fieldnames if name.strip().lower() == "email"), None)
+            if column is None:
+                raise ValueError(CSV_MISSING_EMAIL_COLUMN)
+            emails.extend((row.get(column) or "").strip() for row in rows)
+    emails = [email for email in emails if email]
+    valid_emails = [email for email in emails if len(email) >= MIN_EMAIL_LENGTH]
+    return valid_emails, len(emails) - len(valid_emails)
+
+def _decode_csv(data: bytes) -> str:
+    """Decode an uploaded CSV as UTF-8 (with or without BOM), falling back to Windows-1252"""
+    for encoding in CSV_ENCODINGS:
+        try:
+            return data.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    raise ValueError("Não foi possível ler o ficheiro CSV. Guarde-o com a codificação UTF-8 e tente novamente.")
@@ -0,0 +1,89 @@
+import string
+
+
+# Categories of points a reply can address
+RESPONSE_CATEGORIES = {
+    "Resolução de Problemas": (
+        "Explicar causa do problema",
+        "Oferecer substituição gratuita",
+        "Informar sobre reembolso",
+        "Pedir desculpas por atraso na entrega",
+        "Explicar política de devoluções"
+    ),
+    "Informações sobre Produtos": (
+        "Fornecer informações sobre tamanhos",
+        "Explicar materiais e cuidados",
+        "Informar sobre disponibilidade",
+        "Explicar processo de personalização",
+        "Fornecer guia de medidas"
+    ),
+    "Envios e Portes": (
+        "Explicar que portes gratis não são possíveis",
+        "Informar prazo de entrega estimado",
+        "Fornecer informação de tracking",
+        "Explicar custos de envio internacional"
+    ),
+    "Ofertas e Descontos": (
+        "Oferecer desconto compensatório",
+        "Informar sobre promoções atuais",
+        "Oferecer voucher de desconto futuro",
+        "Explicar programa de fidelidade"
+    )
+}
+
+# (category, option) pairs, flattened so they fit in a single widget
+RESPONSE_OPTIONS = tuple(
+    (category, option)
+    for category, options in RESPONSE_CATEGORIES.items()
+    for option in options
+)
+
+# Expressions the replies must never use
+AVOID_WORDS = (
+    "Desculpe",
+    "Desculpa",
+    "culpa",
+    "nossa culpa",
+    "erro nosso",
+    "falha nossa",
+    "não podemos",
+    "impossível",
+    "não é possível",
+    "complicado"
+)
+_AVOID_JOINED = ", ".join(AVOID_WORDS)
+
+# Static system preamble. It stays byte-identical between calls so OpenAI can
+# serve it from its prompt cache; anything that varies per request belongs in
+# the second message instead.
+SYSTEM_PROMPT = f"""
+Act as a polite customer service agent for a clothing brand.
+Your task is to generate a polite, brand-consistent email reply in Portuguese from Portugal.
+
+Avoid these expressions/words:
+{_AVOID_JOINED}
+
+Key requirements:
+1. Use Portuguese from Portugal
+2. Be polite and concise
+3. Maintain a professional tone
+4. Focus on solutions
+"""
+
+# Per-request instructions, sent after SYSTEM_PROMPT so the static preamble
+# stays the byte-exact prefix of every call and OpenAI can reuse its prompt cache
+REQUEST_PROMPT_TEMPLATE = string.Template("""
+Guidelines for this reply:
+- Tone: $tone
+- Maximum length: $max_length words
+- Include signature: $include_signature
+- Include contact info: $include_contact
+- Use the following greeting: $greeting
+
+The reply email should address the following points:
+$selected_responses
+
+$additional_instructions
+
+$manager_note
+""")